@@ -0,0 +1,498 @@
+"""
+Shared helpers for the Cliniko API test scripts
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import certifi
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+DEFAULT_BASE_URL = "https://api.uk2.cliniko.com/v1"
+
+# Concurrent requests share the keep-alive pool, so never run more workers than
+# it holds - urllib3 discards the extra connections and the next burst pays for
+# fresh TLS handshakes again
+POOL_MAXSIZE = 32
+MAX_WORKERS = 8
+
+# (connect, read) seconds - a stalled call must not hold a pooled connection forever
+TIMEOUT = (3.05, 15)
+
+# Metadata (businesses, practitioners, appointment types) rarely changes while
+# debugging, so cache it on disk between runs. Availability is never cached.
+CACHE_DIR = Path('.cliniko_cache')
+METADATA_TTL = 300
+
+# Metadata already fetched in this process, shared by every tester
+META_CACHE: Dict[str, Any] = {}
+
+# Cliniko allows 200 requests a minute per user. Every request draws from one
+# shared bucket so a run stays under it rather than tripping 429s and waiting
+# out Retry-After backoffs. Half the quota goes out at full speed - a whole run
+# of the scripts - and the refill covers the other half, so no minute starts
+# more than 200 requests. RETRY's resends happen inside the adapter and take
+# no token, so a minute with 429s, 5xxs or read errors can exceed that; those
+# retries back off first, and after a 429 they wait out its Retry-After.
+RATE_BURST = 100
+RATE_LIMIT = 100 / 60
+
+# Per-request output from the endpoint sweeps; --quiet raises the level to WARNING
+# and --debug lowers it to DEBUG
+log = logging.getLogger("cliniko.test")
+
+
+class SharedSSLContextAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose default-verified connections all use one SSL context
+    
+    The CA certificates are loaded once per adapter instead of on every new TLS
+    connection the pool opens. urllib3 configures the context in place on each
+    handshake, so only requests verified against that same default location
+    share it; verify=False, a custom CA or a client cert get a pool of their own.
+    """
+    
+    def init_poolmanager(self, *args, **kwargs):
+        # Same location requests itself would pick, including the env var
+        # overrides - which, as for requests, may name a directory of certs
+        self.ca_location = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE') or certifi.where()
+        if os.path.isdir(self.ca_location):
+            self.ssl_context = ssl.create_default_context(capath=self.ca_location)
+        elif os.path.exists(self.ca_location):
+            self.ssl_context = ssl.create_default_context(cafile=self.ca_location)
+        else:
+            # Leave a bad path to cert_verify(), which reports it on the first request
+            self.ssl_context = None
+        return super().init_poolmanager(*args, **kwargs)
+    
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        if self._uses_shared_context(verify, cert):
+            # The context already trusts these certs - passing them as well makes
+            # urllib3 load them into it again for each connection
+            pool_kwargs.pop('ca_certs', None)
+            pool_kwargs.pop('ca_cert_dir', None)
+            pool_kwargs['ssl_context'] = self.ssl_context
+        return host_params, pool_kwargs
+    
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if conn.conn_kw.get('ssl_context') is self.ssl_context is not None:
+            conn.ca_certs = None
+            conn.ca_cert_dir = None
+    
+    def _uses_shared_context(self, verify, cert) -> bool:
+        """Whether a request verifies against exactly the certs in the shared context"""
+        location = certifi.where() if verify is True else verify
+        return self.ssl_context is not None and cert is None and location == self.ca_location
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket
+    
+    Up to burst requests go out at once, then one every 1/rate seconds.
+    """
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        Block until a request may be sent
+        
+        Args:
+            stop: Event that abandons the wait when set
+            
+        Returns:
+            True if the request may be sent, False if stop was set first
+        """
+        if stop is not None and stop.is_set():
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now even if it isn't there yet, so each waiting
+            # thread sleeps for its own slot outside the lock
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+        if wait <= 0:
+            return True
+        if stop is None:
+            time.sleep(wait)
+        elif stop.wait(wait):
+            # Hand the unused slot back
+            with self._lock:
+                self._tokens += 1
+            return False
+        return True
+
+
+LIMITER = RateLimiter(RATE_LIMIT, RATE_BURST)
+
+
+class RequestCancelled(requests.RequestException):
+    """A request was abandoned while waiting for the rate limiter"""
+
+
+class ClinikoSession(requests.Session):
+    """
+    Session whose requests all draw from the shared rate limiter
+    
+    Pass stop=<threading.Event> to any request method to abandon it if the
+    event is set before the limiter lets it through.
+    """
+    
+    def request(self, method, url, *args, stop: Optional[threading.Event] = None, **kwargs):
+        if not LIMITER.acquire(stop):
+            raise RequestCancelled(f"{method} {url} cancelled before it was sent")
+        return super().request(method, url, *args, **kwargs)
+
+
+RETRY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=[429, 500, 502, 503, 504],
+    # Hand the final response back so the scripts can still report it
+    raise_on_status=False
+)
+
+# The connection pools live on the adapters, so every session mounts these same
+# instances - repeated calls to the same shard reuse the open keep-alive
+# connection instead of a new TLS handshake, whichever tester makes them
+HTTPS_ADAPTER = SharedSSLContextAdapter(
+    pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY
+)
+# Plain HTTP (a local mock or proxy of the API) gets the same pooling and retries
+HTTP_ADAPTER = HTTPAdapter(
+    pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY
+)
+
+
+def make_session() -> ClinikoSession:
+    """
+    Create a session on the shared connection pools
+    
+    Each tester gets its own session so its auth headers stay its own.
+    
+    Returns:
+        A new session with no auth headers set
+    """
+    session = ClinikoSession()
+    session.mount("https://", HTTPS_ADAPTER)
+    session.mount("http://", HTTP_ADAPTER)
+    # Ask for every encoding urllib3 can decode here (br when brotli is installed)
+    session.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+    # HTTP/1.1 connections are persistent by default, so this header only adds bytes
+    # to every probe
+    del session.headers['Connection']
+    return session
+
+
+def configure_logging(quiet: bool = False, debug: bool = False) -> None:
+    """
+    Send the testers' log output to stdout alongside their other output
+    
+    Args:
+        quiet: Only show warnings and errors from the endpoint sweeps
+        debug: Also show debug detail such as full response headers
+    """
+    if debug:
+        level = logging.DEBUG
+    elif quiet:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+    # Only our logger changes level, so urllib3's debug chatter stays hidden
+    logging.basicConfig(format='%(message)s', stream=sys.stdout)
+    log.setLevel(level)
+
+
+@lru_cache(maxsize=None)
+def build_auth_headers(api_key: str, user_agent: str = "Cliniko-Tester/1.0") -> Dict[str, str]:
+    """
+    Build the Cliniko request headers for an API key
+    
+    Args:
+        api_key: Your Cliniko API key
+        user_agent: User-Agent to identify the calling script
+        
+    Returns:
+        Dict of headers to apply to the session (shared - do not modify)
+    """
+    # Cliniko expects: base64(api_key:)
+    token = base64.b64encode(f"{api_key}:".encode("ascii")).decode("ascii")
+    # No Content-Type - every request is a bodiless GET; session.post(json=...)
+    # sets it on the request itself if a write is ever added
+    return {
+        'Authorization': f'Basic {token}',
+        'Accept': 'application/json',
+        'User-Agent': user_agent
+    }
+
+
+def fetch_all(session: ClinikoSession, jobs: Iterable[Tuple[str, Optional[Dict[str, Any]]]],
+              max_workers: int = MAX_WORKERS) -> List[Union[requests.Response, Exception]]:
+    """
+    Send independent GET requests concurrently over a shared session
+    
+    Args:
+        session: Session from make_session() to send the requests on
+        jobs: (url, params) pairs to request
+        max_workers: Maximum number of requests in flight at once (capped at POOL_MAXSIZE)
+        
+    Returns:
+        List holding each response, or the exception it raised, in job order
+    """
+    with ThreadPoolExecutor(max_workers=min(max_workers, POOL_MAXSIZE)) as pool:
+        return list(pool.map(lambda job: _probe(session, *job), jobs))
+
+
+def fetch_until_success(session: ClinikoSession, jobs: Iterable[Tuple[str, Optional[Dict[str, Any]]]],
+                        max_workers: int = MAX_WORKERS) -> List[Tuple[int, Union[requests.Response, Exception]]]:
+    """
+    Send GET requests concurrently and stop at the first 200 response
+    
+    Requests that have not been sent when a 200 arrives are cancelled, including
+    any waiting on the rate limiter. Those already sent still reach Cliniko, so
+    their responses are waited for and returned too.
+    
+    Args:
+        session: Session from make_session() to send the requests on
+        jobs: (url, params) pairs to request
+        max_workers: Maximum number of requests in flight at once (capped at POOL_MAXSIZE)
+        
+    Returns:
+        (job index, response or exception) pairs in the order they completed,
+        leaving out the cancelled jobs
+    """
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, POOL_MAXSIZE))
+    stop = threading.Event()
+    futures = {pool.submit(_probe, session, url, params, stop): i for i, (url, params) in enumerate(jobs)}
+    results = []
+    try:
+        for future in as_completed(futures):
+            response = future.result()
+            results.append((futures[future], response))
+            if not isinstance(response, Exception) and response.status_code == 200:
+                break
+    finally:
+        # Workers already past submit() may be queued on the limiter - release them too
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    reported = {index for index, _ in results}
+    in_flight = [future for future, index in futures.items() if index not in reported and not future.cancelled()]
+    for future in as_completed(in_flight):
+        response = future.result()
+        if not isinstance(response, RequestCancelled):
+            results.append((futures[future], response))
+    return results
+
+
+def _probe(session: ClinikoSession, url: str, params: Optional[Dict[str, Any]],
+           stop: Optional[threading.Event] = None):
+    """GET a URL, returning the exception instead of raising it"""
+    try:
+        return session.get(url, params=params, timeout=TIMEOUT, stop=stop)
+    except Exception as e:
+        return e
+
+
+def response_json(response: requests.Response) -> Any:
+    """
+    Decode a response body as JSON, with orjson when it is installed
+    
+    Args:
+        response: Response from the Cliniko API
+        
+    Returns:
+        The decoded JSON data
+    """
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def error_json(response: requests.Response) -> Optional[Any]:
+    """
+    Decode an error response body if Cliniko sent it as JSON
+    
+    Args:
+        response: Error response from the Cliniko API
+        
+    Returns:
+        The decoded JSON data, or None for a non-JSON or malformed body
+    """
+    # Proxies and load balancers answer with HTML, so check before trying to decode
+    if not response.headers.get('content-type', '').startswith('application/json'):
+        return None
+    try:
+        return response_json(response)
+    except ValueError:
+        return None
+
+
+def snippet(response: requests.Response, limit: int = 500) -> str:
+    """
+    First bytes of a response body for error output
+    
+    Args:
+        response: Response from the Cliniko API
+        limit: Maximum number of bytes to show
+        
+    Returns:
+        The start of the body, decoded as UTF-8
+    """
+    return response.content[:limit].decode('utf-8', 'replace')
+
+
+def save_json(filename: str, data: Any) -> None:
+    """
+    Save data as indented JSON with a single write
+    
+    Args:
+        filename: Path of the file to write
+        data: JSON-serialisable data to save
+    """
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(data, indent=2).encode()
+    Path(filename).write_bytes(payload)
+
+
+def save_raw_response(response: requests.Response, filename: str) -> None:
+    """
+    Save a response body as Cliniko sent it, without decoding and re-encoding it
+    
+    Args:
+        response: Response whose body is only being saved
+        filename: Path of the file to write
+    """
+    Path(filename).write_bytes(response.content)
+
+
+def get_or_fetch(session: requests.Session, url: str, params: Optional[Dict[str, Any]] = None,
+                 ttl: int = METADATA_TTL) -> Any:
+    """
+    Get metadata from this process, the disk cache or Cliniko, in that order
+    
+    Args:
+        session: Session to send the request on if nothing is cached
+        url: Metadata endpoint to GET
+        params: Optional query parameters
+        ttl: Maximum age in seconds of a disk cache entry
+        
+    Returns:
+        The decoded JSON data, or None if Cliniko returned an error status
+    """
+    key = _cache_key(session, url, params)
+    if key in META_CACHE:
+        return META_CACHE[key]
+    
+    data = load_cached(session, url, params, ttl)
+    if data is None:
+        response = session.get(url, params=params, timeout=TIMEOUT)
+        # Error statuses are routine while probing, so check the code rather
+        # than raising and unwinding an HTTPError for each one
+        if response.status_code != 200:
+            log.warning("HTTP %s from %s: %s", response.status_code, url, snippet(response))
+            return None
+        data = response_json(response)
+        store_cached(session, url, data, params)
+    
+    META_CACHE[key] = data
+    return data
+
+
+def _cache_key(session: requests.Session, url: str, params: Optional[Dict[str, Any]]) -> str:
+    """Cache key for a request, covering the account as well as the URL"""
+    key = repr((session.headers.get('Authorization'), url, sorted((params or {}).items())))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _cache_path(session: requests.Session, url: str, params: Optional[Dict[str, Any]]) -> Path:
+    """Disk cache file for a request"""
+    return CACHE_DIR / f"{_cache_key(session, url, params)}.json"
+
+
+def load_cached(session: requests.Session, url: str, params: Optional[Dict[str, Any]] = None,
+                ttl: int = METADATA_TTL) -> Optional[Any]:
+    """
+    Load a cached GET response body if it is younger than ttl seconds
+    
+    Returns:
+        The cached JSON data or None if there is no fresh entry
+    """
+    path = _cache_path(session, url, params)
+    try:
+        if time.time() - path.stat().st_mtime < ttl:
+            raw = path.read_bytes()
+            return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def store_cached(session: requests.Session, url: str, data: Any,
+                 params: Optional[Dict[str, Any]] = None) -> None:
+    """Cache a successful GET response body for load_cached()"""
+    payload = orjson.dumps(data) if orjson is not None else json.dumps(data).encode()
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        _cache_path(session, url, params).write_bytes(payload)
+    except OSError as e:
+        log.warning("⚠️  Could not write response cache: %s", e)
+
+
+class BaseClinikoTester:
+    """
+    Session, auth and cache wiring shared by the Cliniko tester classes
+    
+    Every tester has its own session on the shared connection pools and uses the
+    process-wide metadata cache, so testers built in the same run share
+    connections and lookups but not credentials.
+    """
+    
+    user_agent = 'Cliniko-Tester/1.0'
+    
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL):
+        """
+        Initialize the tester
+        
+        Args:
+            api_key: Your Cliniko API key
+            base_url: Base URL for Cliniko API (default: UK shard)
+        """
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.session = make_session()
+        self.session.headers.update(build_auth_headers(api_key, self.user_agent))
+        
+        # Appointment type names only change in the Cliniko UI, so share them per account
+        self._apt_name_cache = META_CACHE.setdefault(_cache_key(self.session, 'apt_names', None), {})
@@ -4,37 +4,24 @@ Cliniko API Test Script
 Test connection to Cliniko API and retrieve business information
 """
 
-import requests
-import json
+import argparse
+import logging
 import os
-import base64
 from typing import Dict, Any, Optional
 
-class ClinikoAPITester:
-    def __init__(self, api_key: str, base_url: str = "https://api.uk2.cliniko.com/v1"):
-        """
-        Initialize the Cliniko API tester
-        
-        Args:
-            api_key: Your Cliniko API key
-            base_url: Base URL for Cliniko API (default: UK shard)
-        """
-        self.api_key = api_key
-        self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        
-        # Properly encode API key with colon for basic auth
-        # Cliniko expects: base64(api_key:)
-        auth_string = f"{api_key}:"
-        encoded_auth = base64.b64encode(auth_string.encode()).decode()
-        
-        # Set up authentication headers
-        self.session.headers.update({
-            'Authorization': f'Basic {encoded_auth}',
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'User-Agent': 'Cliniko-API-Tester/1.0'
-        })
+from cliniko_common import (
+    TIMEOUT,
+    BaseClinikoTester,
+    configure_logging,
+    get_or_fetch,
+    log,
+    response_json,
+    save_json,
+    snippet,
+)
+
+class ClinikoAPITester(BaseClinikoTester):
+    user_agent = 'Cliniko-API-Tester/1.0'
     
     def test_connection(self) -> bool:
         """
@@ -44,11 +31,12 @@ class ClinikoAPITester:
             bool: True if connection successful, False otherwise
         """
         try:
-            response = self.session.get(f"{self.base_url}/businesses")
+            response = self.session.get(f"{self.base_url}/businesses", timeout=TIMEOUT)
             print(f"Connection test status: {response.status_code}")
             if response.status_code != 200:
-                print(f"Response headers: {dict(response.headers)}")
-                print(f"Response body: {response.text}")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Response headers:\n%s", "\n".join(f"{k}: {v}" for k, v in response.headers.items()))
+                print(f"Response body: {snippet(response)}")
             return response.status_code == 200
         except Exception as e:
             print(f"Connection test failed: {e}")
@@ -62,13 +50,7 @@ class ClinikoAPITester:
             Dict containing business data or None if failed
         """
         try:
-            response = self.session.get(f"{self.base_url}/businesses")
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            print(f"HTTP Error: {e}")
-            print(f"Response: {response.text}")
-            return None
+            return get_or_fetch(self.session, f"{self.base_url}/businesses")
         except Exception as e:
             print(f"Error retrieving businesses: {e}")
             return None
@@ -85,13 +67,7 @@ class ClinikoAPITester:
         """
         try:
             url = f"{self.base_url}/businesses/{business_id}/practitioners"
-            response = self.session.get(url)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            print(f"HTTP Error getting practitioners: {e}")
-            print(f"Response: {response.text}")
-            return None
+            return get_or_fetch(self.session, url)
         except Exception as e:
             print(f"Error retrieving practitioners: {e}")
             return None
@@ -109,13 +85,7 @@ class ClinikoAPITester:
         """
         try:
             url = f"{self.base_url}/businesses/{business_id}/practitioners/{practitioner_id}/appointment_types"
-            response = self.session.get(url)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            print(f"HTTP Error getting appointment types: {e}")
-            print(f"Response: {response.text}")
-            return None
+            return get_or_fetch(self.session, url)
         except Exception as e:
             print(f"Error retrieving appointment types: {e}")
             return None
@@ -149,18 +119,15 @@ class ClinikoAPITester:
             if params:
                 print(f"📅 Query parameters: {params}")
             
-            response = self.session.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=TIMEOUT)
             print(f"Response status: {response.status_code}")
             
-            if response.status_code != 200:
-                print(f"Response headers: {dict(response.headers)}")
-                print(f"Response body: {response.text}")
+            if response.status_code == 200:
+                return response_json(response)
             
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            print(f"HTTP Error getting available times: {e}")
-            print(f"Response: {response.text}")
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Response headers:\n%s", "\n".join(f"{k}: {v}" for k, v in response.headers.items()))
+            log.warning("HTTP %s getting available times: %s", response.status_code, snippet(response))
             return None
         except Exception as e:
             print(f"Error retrieving available times: {e}")
@@ -239,8 +206,7 @@ def test_specific_endpoint():
         print(f"📄 Response structure: {list(available_times.keys())}")
         
         # Save response for analysis
-        with open('available_times_response.json', 'w') as f:
-            json.dump(available_times, f, indent=2)
+        save_json('available_times_response.json', available_times)
         print("💾 Response saved to: available_times_response.json")
         
         # Print sample data
@@ -262,6 +228,12 @@ def test_specific_endpoint():
 
 def main():
     """Main function to run the API test"""
+    parser = argparse.ArgumentParser(description="Test the Cliniko API connection")
+    parser.add_argument('--debug', action='store_true',
+                        help="Show full response headers for failed requests")
+    args = parser.parse_args()
+    configure_logging(debug=args.debug)
+    
     print("🔗 Cliniko API Connection Tester (UK2 Shard)")
     print("=" * 50)
     
@@ -305,8 +277,7 @@ def main():
     tester.print_business_info(businesses_data)
     
     # Also save raw data to file for reference
-    with open('cliniko_businesses.json', 'w') as f:
-        json.dump(businesses_data, f, indent=2)
+    save_json('cliniko_businesses.json', businesses_data)
     print(f"\n💾 Raw API response saved to: cliniko_businesses.json")
     
     print("\n🎉 Basic API test completed successfully!")
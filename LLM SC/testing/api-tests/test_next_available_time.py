@@ -3,32 +3,41 @@
 Test the next_available_time endpoint suggested by the user
 """
 
-import requests
+import argparse
 import json
+import logging
 import os
-import base64
 from datetime import datetime, timedelta
 
-class NextAvailableTimeTester:
-    def __init__(self, api_key: str, base_url: str = "https://api.uk2.cliniko.com/v1"):
-        self.api_key = api_key
-        self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        
-        # Properly encode API key
-        auth_string = f"{api_key}:"
-        encoded_auth = base64.b64encode(auth_string.encode()).decode()
-        
-        self.session.headers.update({
-            'Authorization': f'Basic {encoded_auth}',
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'User-Agent': 'NextAvailableTime-Tester/1.0'
-        })
+from cliniko_common import (
+    DEFAULT_BASE_URL,
+    TIMEOUT,
+    BaseClinikoTester,
+    configure_logging,
+    error_json,
+    fetch_all,
+    fetch_until_success,
+    get_or_fetch,
+    log,
+    response_json,
+    save_json,
+    snippet,
+)
+
+class NextAvailableTimeTester(BaseClinikoTester):
+    user_agent = 'NextAvailableTime-Tester/1.0'
+    
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL):
+        super().__init__(api_key, base_url)
         
         self.business_id = "1740586889502532285"
         self.practitioner_id = "1740586886222586607"  # Correct ID
         self.appointment_type_ids = ["1740586888823054369", "1740586889158598690"]
+        
+        self._apt_catalog_loaded = False
+        
+        # Set once a next_available_time variation returns 200
+        self._discovered_url = None
     
     def test_next_available_time_endpoints(self):
         """Test the next_available_time endpoints"""
@@ -68,12 +77,12 @@ class NextAvailableTimeTester:
             
             try:
                 # Test without parameters first
-                response = self.session.get(url)
+                response = self.session.get(url, timeout=TIMEOUT)
                 print(f"   Status: {response.status_code}")
                 
                 if response.status_code == 200:
                     print(f"   🎉 SUCCESS! next_available_time works!")
-                    data = response.json()
+                    data = response_json(response)
                     print(f"   Response keys: {list(data.keys())}")
                     
                     # Pretty print the response
@@ -82,29 +91,28 @@ class NextAvailableTimeTester:
                     
                     # Save successful response
                     filename = f"success_next_available_time_{apt_name.replace(' ', '_')}.json"
-                    with open(filename, 'w') as f:
-                        json.dump({
-                            "endpoint": url,
-                            "appointment_type": apt_name,
-                            "appointment_type_id": apt_id,
-                            "response": data
-                        }, f, indent=2)
+                    save_json(filename, {
+                        "endpoint": url,
+                        "appointment_type": apt_name,
+                        "appointment_type_id": apt_id,
+                        "response": data
+                    })
                     print(f"   💾 Saved successful response to: {filename}")
                     
                 elif response.status_code == 422:
                     print(f"   ⚠️  422 - Validation Error (may need parameters)")
-                    try:
-                        error_data = response.json()
+                    error_data = error_json(response)
+                    if error_data is not None:
                         print(f"   Error details: {json.dumps(error_data, indent=4)}")
-                    except:
-                        print(f"   Error text: {response.text}")
+                    else:
+                        print(f"   Error text: {snippet(response)}")
                         
                 elif response.status_code == 404:
                     print(f"   ❌ 404 - Endpoint not found")
                     
                 else:
                     print(f"   ⚠️  Status {response.status_code}")
-                    print(f"   Response: {response.text[:200]}")
+                    print(f"   Response: {snippet(response, 200)}")
                     
             except Exception as e:
                 print(f"   ❌ Exception: {e}")
@@ -114,11 +122,15 @@ class NextAvailableTimeTester:
     def test_next_available_time_variations(self):
         """Test different URL structures for next_available_time"""
         
+        if self._discovered_url:
+            log.info("   Already found a working endpoint: %s", self._discovered_url)
+            return
+        
         apt_id = self.appointment_type_ids[0]  # Use first appointment type
         apt_name = self.get_appointment_type_name(apt_id)
         
-        print(f"   Testing variations with: {apt_name} (ID: {apt_id})")
-        print()
+        log.info("   Testing variations with: %s (ID: %s)", apt_name, apt_id)
+        log.info("")
         
         # Different URL patterns to test
         variations = [
@@ -141,37 +153,51 @@ class NextAvailableTimeTester:
             f"{self.base_url}/businesses/{self.business_id}/next_available_time"
         ]
         
-        for i, url in enumerate(variations, 1):
-            print(f"      Variation {i}: {url}")
+        # Send the probes together and stop as soon as one of them works; any
+        # already sent by then are still reported
+        results = fetch_until_success(self.session, [(url, None) for url in variations])
+        
+        # Report in variation order, whichever probe happened to finish first
+        for index, response in sorted(results, key=lambda r: r[0]):
+            i = index + 1
+            url = variations[index]
+            log.info("      Variation %s: %s", i, url)
             
             try:
-                response = self.session.get(url)
-                print(f"         Status: {response.status_code}")
+                if isinstance(response, Exception):
+                    raise response
+                log.info("         Status: %s", response.status_code)
                 
                 if response.status_code == 200:
-                    print(f"         🎉 SUCCESS!")
-                    data = response.json()
-                    print(f"         Response keys: {list(data.keys())}")
+                    log.info("         🎉 SUCCESS!")
+                    # Probes already in flight can succeed too - keep the first
+                    self._discovered_url = self._discovered_url or url
+                    data = response_json(response)
+                    log.info("         Response keys: %s", list(data.keys()))
                     
                     filename = f"success_variation_{i}_next_available_time.json"
-                    with open(filename, 'w') as f:
-                        json.dump({
-                            "endpoint": url,
-                            "variation": i,
-                            "response": data
-                        }, f, indent=2)
-                    print(f"         💾 Saved to: {filename}")
+                    save_json(filename, {
+                        "endpoint": url,
+                        "variation": i,
+                        "response": data
+                    })
+                    log.info("         💾 Saved to: %s", filename)
                     
                 elif response.status_code == 422:
-                    print(f"         ⚠️  422 - May need parameters")
+                    log.info("         ⚠️  422 - May need parameters")
                     
                 elif response.status_code != 404:
-                    print(f"         ⚠️  Different status: {response.status_code}")
+                    log.info("         ⚠️  Different status: %s", response.status_code)
                     
             except Exception as e:
-                print(f"         ❌ Exception: {e}")
+                log.error("         ❌ Exception: %s", e)
             
-            print()
+            log.info("")
+        
+        skipped = len(variations) - len(results)
+        if skipped:
+            log.info("      ⏭️  Skipped %s remaining variation(s) after finding a working endpoint", skipped)
+            log.info("")
     
     def test_with_parameters(self):
         """Test next_available_time endpoints with various parameters"""
@@ -182,9 +208,9 @@ class NextAvailableTimeTester:
         # Base URL (user's suggested endpoint)
         url = f"{self.base_url}/businesses/{self.business_id}/practitioners/{self.practitioner_id}/appointment_types/{apt_id}/next_available_time"
         
-        print(f"   Testing parameters with: {apt_name}")
-        print(f"   Base URL: {url}")
-        print()
+        log.info("   Testing parameters with: %s", apt_name)
+        log.info("   Base URL: %s", url)
+        log.info("")
         
         # Different parameter combinations
         param_sets = [
@@ -223,60 +249,87 @@ class NextAvailableTimeTester:
             }
         ]
         
-        for i, params in enumerate(param_sets, 1):
-            print(f"      Parameter set {i}: {params}")
+        responses = fetch_all(self.session, [(url, params) for params in param_sets])
+        
+        for i, (params, response) in enumerate(zip(param_sets, responses), 1):
+            log.info("      Parameter set %s: %s", i, params)
             
             try:
-                response = self.session.get(url, params=params)
-                print(f"         Status: {response.status_code}")
+                if isinstance(response, Exception):
+                    raise response
+                log.info("         Status: %s", response.status_code)
                 
                 if response.status_code == 200:
-                    print(f"         🎉 SUCCESS with parameters!")
-                    data = response.json()
-                    print(f"         Response keys: {list(data.keys())}")
+                    log.info("         🎉 SUCCESS with parameters!")
+                    data = response_json(response)
+                    log.info("         Response keys: %s", list(data.keys()))
                     
                     # Show the next available time
                     if 'next_available_time' in data:
-                        print(f"         📅 Next available: {data['next_available_time']}")
+                        log.info("         📅 Next available: %s", data['next_available_time'])
                     
                     filename = f"success_with_params_{i}_next_available_time.json"
-                    with open(filename, 'w') as f:
-                        json.dump({
-                            "endpoint": url,
-                            "params": params,
-                            "response": data
-                        }, f, indent=2)
-                    print(f"         💾 Saved to: {filename}")
+                    save_json(filename, {
+                        "endpoint": url,
+                        "params": params,
+                        "response": data
+                    })
+                    log.info("         💾 Saved to: %s", filename)
                     
                 elif response.status_code == 422:
-                    print(f"         ⚠️  422 - Validation Error")
-                    try:
-                        error_data = response.json()
-                        print(f"         Error: {json.dumps(error_data, indent=8)}")
-                    except:
-                        print(f"         Error text: {response.text}")
+                    log.info("         ⚠️  422 - Validation Error")
+                    error_data = error_json(response)
+                    if error_data is not None:
+                        if log.isEnabledFor(logging.INFO):
+                            log.info("         Error: %s", json.dumps(error_data, indent=8))
+                    else:
+                        log.info("         Error text: %s", snippet(response))
                         
                 elif response.status_code != 404:
-                    print(f"         ⚠️  Status {response.status_code}: {response.text[:100]}")
+                    log.info("         ⚠️  Status %s: %s", response.status_code, snippet(response, 100))
                     
             except Exception as e:
-                print(f"         ❌ Exception: {e}")
+                log.error("         ❌ Exception: %s", e)
             
-            print()
+            log.info("")
     
     def get_appointment_type_name(self, apt_id: str) -> str:
         """Get the name of an appointment type"""
+        if not self._apt_catalog_loaded:
+            self.load_appointment_type_names()
+        if apt_id in self._apt_name_cache:
+            return self._apt_name_cache[apt_id]
+        
         try:
-            url = f"{self.base_url}/appointment_types/{apt_id}"
-            response = self.session.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('name', 'Unknown')
+            data = get_or_fetch(self.session, f"{self.base_url}/appointment_types/{apt_id}")
+            # Remember a missing type too, so it is only fetched (and warned
+            # about) once per run - the name is just a label
+            self._apt_name_cache[apt_id] = (data or {}).get('name', 'Unknown')
+            return self._apt_name_cache[apt_id]
         except:
             pass
         return 'Unknown'
+    
+    def load_appointment_type_names(self):
+        """Fill the name cache from one appointment type list request instead of a GET per ID"""
+        self._apt_catalog_loaded = True
+        url = f"{self.base_url}/appointment_types"
+        params = {'per_page': 100}
+        
+        try:
+            data = get_or_fetch(self.session, url, params) or {}
+            for apt in data.get('appointment_types', []):
+                self._apt_name_cache[str(apt.get('id'))] = apt.get('name', 'Unknown')
+        except Exception as e:
+            print(f"   ⚠️  Could not load appointment types: {e}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Test the Cliniko next_available_time endpoint")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Only show warnings and errors from the endpoint sweeps")
+    args = parser.parse_args()
+    configure_logging(args.quiet)
+    
     print("🎯 Testing Next Available Time Endpoint")
     print("=" * 50)
     print("Testing the next_available_time endpoint suggested by user")
@@ -3,30 +3,48 @@
 Test the working endpoint patterns we discovered to find available_times
 """
 
-import requests
-import json
+import argparse
+import logging
 import os
-import base64
 from datetime import datetime, timedelta
 
-class WorkingPatternTester:
-    def __init__(self, api_key: str, base_url: str = "https://api.uk2.cliniko.com/v1"):
-        self.api_key = api_key
-        self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        
-        # Properly encode API key
-        auth_string = f"{api_key}:"
-        encoded_auth = base64.b64encode(auth_string.encode()).decode()
-        
-        self.session.headers.update({
-            'Authorization': f'Basic {encoded_auth}',
-            'Content-Type': 'application/json',
-            'Accept': 'application/json',
-            'User-Agent': 'Working-Pattern-Tester/1.0'
-        })
+from cliniko_common import (
+    DEFAULT_BASE_URL,
+    TIMEOUT,
+    BaseClinikoTester,
+    configure_logging,
+    error_json,
+    fetch_all,
+    fetch_until_success,
+    log,
+    response_json,
+    save_json,
+    save_raw_response,
+    snippet,
+)
+
+class WorkingPatternTester(BaseClinikoTester):
+    user_agent = 'Working-Pattern-Tester/1.0'
+    
+    # Since direct practitioner access works, try these sub-resources of it
+    _PRACTITIONER_SUFFIXES = (
+        # Practitioner-based availability
+        'availability', 'schedule', 'available_slots', 'bookable_times',
+        # Maybe there's a different endpoint name for available times
+        'time_slots', 'booking_times',
+        # Try with different URL patterns we haven't tested
+        'available', 'times',
+    )
+    
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL):
+        super().__init__(api_key, base_url)
         
         self.practitioner_id = "1740586886222586607"  # Correct ID
+        # (suffix, url) pairs - the suffix also names any file saved for the URL
+        self._practitioner_urls = tuple(
+            (suffix, f"{self.base_url}/practitioners/{self.practitioner_id}/{suffix}")
+            for suffix in self._PRACTITIONER_SUFFIXES
+        )
     
     def test_working_patterns(self):
         """Test the working endpoint patterns for available_times"""
@@ -57,11 +75,11 @@ class WorkingPatternTester:
         
         try:
             print(f"   URL: {url}")
-            response = self.session.get(url)
+            response = self.session.get(url, timeout=TIMEOUT)
             print(f"   Status: {response.status_code}")
             
             if response.status_code == 200:
-                data = response.json()
+                data = response_json(response)
                 appointment_types = data.get('appointment_types', [])
                 print(f"   ✅ Found {len(appointment_types)} appointment types:")
                 
@@ -81,13 +99,12 @@ class WorkingPatternTester:
                             print(f"         {field}: {apt[field]}")
                 
                 # Save the appointment types data
-                with open('practitioner_appointment_types.json', 'w') as f:
-                    json.dump(data, f, indent=2)
+                save_json('practitioner_appointment_types.json', data)
                 print(f"   💾 Saved appointment types to: practitioner_appointment_types.json")
                 
                 return appointment_types
             else:
-                print(f"   ❌ Error: {response.status_code} - {response.text}")
+                print(f"   ❌ Error: {response.status_code} - {snippet(response)}")
                 return None
                 
         except Exception as e:
@@ -105,134 +122,214 @@ class WorkingPatternTester:
             'to': next_week.strftime('%Y-%m-%d')
         }
         
+        # Loop-invariant parts of the three patterns
+        practitioner_url = f"{self.base_url}/practitioners/{self.practitioner_id}"
+        params_with_prac = {**date_params, 'practitioner_id': self.practitioner_id}
+        
+        # Build every probe up front in one pass so they can be sent together
+        jobs = []
         for apt in appointment_types:
             apt_id = apt.get('id')
             apt_name = apt.get('name', 'Unknown')
+            apt_url = f"{self.base_url}/appointment_types/{apt_id}/available_times"
+            jobs += [
+                # Pattern 1: Direct from practitioner (following the working pattern)
+                (apt, f"{practitioner_url}/appointment_types/{apt_id}/available_times", date_params,
+                 f"practitioner_path_{apt_name}"),
+                # Pattern 2: Direct from appointment type (also working)
+                (apt, apt_url, date_params, f"direct_apt_type_{apt_name}"),
+                # Pattern 3: Add practitioner as query parameter to global appointment type
+                (apt, apt_url, params_with_prac, f"apt_type_with_prac_param_{apt_name}"),
+            ]
+        
+        responses = fetch_all(self.session, [(url, params) for _, url, params, _ in jobs])
+        
+        current_apt = None
+        for (apt, url, params, label), response in zip(jobs, responses):
+            if apt is not current_apt:
+                current_apt = apt
+                log.info("\n   🎯 Testing available_times for: %s (ID: %s)", apt.get('name', 'Unknown'), apt.get('id'))
+                log.info("   %s", '─' * 50)
             
-            print(f"\n   🎯 Testing available_times for: {apt_name} (ID: {apt_id})")
-            print(f"   {'─' * 50}")
-            
-            # Pattern 1: Direct from practitioner (following the working pattern)
-            url1 = f"{self.base_url}/practitioners/{self.practitioner_id}/appointment_types/{apt_id}/available_times"
-            self.test_available_times_endpoint(url1, date_params, f"practitioner_path_{apt_name}")
-            
-            # Pattern 2: Direct from appointment type (also working)
-            url2 = f"{self.base_url}/appointment_types/{apt_id}/available_times"
-            self.test_available_times_endpoint(url2, date_params, f"direct_apt_type_{apt_name}")
-            
-            # Pattern 3: Add practitioner as query parameter to global appointment type
-            params_with_prac = {**date_params, 'practitioner_id': self.practitioner_id}
-            self.test_available_times_endpoint(url2, params_with_prac, f"apt_type_with_prac_param_{apt_name}")
+            self.test_available_times_endpoint(url, params, label, response)
     
-    def test_available_times_endpoint(self, url: str, params: dict, label: str):
-        """Test a specific available_times endpoint"""
+    def test_available_times_endpoint(self, url: str, params: dict, label: str, response=None):
+        """Test a specific available_times endpoint, or report a response already fetched for it"""
         
         try:
-            print(f"      Testing: {url}")
-            print(f"      Params: {params}")
+            log.info("      Testing: %s", url)
+            log.info("      Params: %s", params)
             
-            response = self.session.get(url, params=params)
-            print(f"      Status: {response.status_code}")
+            if response is None:
+                response = self.session.get(url, params=params, timeout=TIMEOUT)
+            elif isinstance(response, Exception):
+                raise response
+            log.info("      Status: %s", response.status_code)
             
             if response.status_code == 200:
-                print(f"      🎉 SUCCESS! Available times endpoint works!")
-                data = response.json()
-                print(f"      Response keys: {list(data.keys())}")
+                log.info("      🎉 SUCCESS! Available times endpoint works!")
+                # Decode the whole body in one pass: only the slot count and first
+                # slot are printed, but the full document is saved below, so an
+                # incremental parser would still have to build every slot
+                data = response_json(response)
+                log.info("      Response keys: %s", list(data.keys()))
                 
                 if 'available_times' in data:
                     times = data['available_times']
-                    print(f"      📅 Found {len(times)} available time slots")
+                    log.info("      📅 Found %s available time slots", len(times))
                     if times:
-                        print(f"      📋 Sample slot: {times[0]}")
+                        log.info("      📋 Sample slot: %s", times[0])
                 
                 # Save successful response
                 filename = f"working_available_times_{label}.json"
-                with open(filename, 'w') as f:
-                    json.dump({
-                        "endpoint": url,
-                        "params": params,
-                        "response": data
-                    }, f, indent=2)
-                print(f"      💾 Saved successful response to: {filename}")
+                save_json(filename, {
+                    "endpoint": url,
+                    "params": params,
+                    "response": data
+                })
+                log.info("      💾 Saved successful response to: %s", filename)
                 
             elif response.status_code == 422:
-                print(f"      ⚠️  422 - Validation Error (may need different parameters)")
-                try:
-                    error_data = response.json()
-                    print(f"      Error details: {error_data}")
-                except:
-                    print(f"      Error text: {response.text}")
+                log.info("      ⚠️  422 - Validation Error (may need different parameters)")
+                error_data = error_json(response)
+                if error_data is not None:
+                    log.info("      Error details: %s", error_data)
+                else:
+                    log.info("      Error text: %s", snippet(response))
                     
             elif response.status_code == 404:
-                print(f"      ❌ 404 - Endpoint not found")
+                log.info("      ❌ 404 - Endpoint not found")
             else:
-                print(f"      ❌ Status {response.status_code}: {response.text[:200]}")
+                log.info("      ❌ Status %s: %s", response.status_code, snippet(response, 200))
                 
         except Exception as e:
-            print(f"      ❌ Exception: {e}")
+            log.error("      ❌ Exception: %s", e)
         
-        print()
+        log.info("")
     
     def test_alternative_working_structures(self):
         """Test alternative structures based on working endpoints"""
         
-        # Since direct practitioner access works, try variations
-        alternatives = [
-            # Practitioner-based availability
-            f"{self.base_url}/practitioners/{self.practitioner_id}/availability",
-            f"{self.base_url}/practitioners/{self.practitioner_id}/schedule", 
-            f"{self.base_url}/practitioners/{self.practitioner_id}/available_slots",
-            f"{self.base_url}/practitioners/{self.practitioner_id}/bookable_times",
-            
-            # Maybe there's a different endpoint name for available times
-            f"{self.base_url}/practitioners/{self.practitioner_id}/time_slots",
-            f"{self.base_url}/practitioners/{self.practitioner_id}/booking_times",
-            
-            # Try with different URL patterns we haven't tested
-            f"{self.base_url}/practitioners/{self.practitioner_id}/available",
-            f"{self.base_url}/practitioners/{self.practitioner_id}/times"
-        ]
+        # Ask for every sub-resource inline first; any Cliniko returns that way
+        # doesn't need its own probes
+        included = self.test_included_resources()
+        alternatives = tuple(
+            (suffix, url) for suffix, url in self._practitioner_urls if suffix not in included
+        )
         
         date_params = {
             'from': '2025-08-01',
             'to': '2025-08-07'
         }
         
-        for url in alternatives:
-            print(f"   Testing: {url}")
+        # Every probe is independent, so send them all (each URL without then with
+        # params) together and stop once one endpoint answers 200. Probes already
+        # sent by then are still reported; a missing response was never sent.
+        jobs = [job for _, url in alternatives for job in ((url, None), (url, date_params))]
+        responses = dict(fetch_until_success(self.session, jobs))
+        skipped = len(jobs) - len(responses)
+        
+        for i, (suffix, url) in enumerate(alternatives):
+            response, param_response = responses.get(2 * i), responses.get(2 * i + 1)
+            if response is None and param_response is None:
+                continue
+            
+            # Collect each URL's report and log it in one go rather than a
+            # write (and TTY flush) per line
+            lines = [f"   Testing: {url}"]
+            level = logging.INFO
+            
+            # Both probes were sent independently, so report each on its own -
+            # an exception from one mustn't hide the other's result
+            
+            # Test without params
             try:
-                # Test without params
-                response = self.session.get(url)
-                print(f"      No params: {response.status_code}")
-                
-                if response.status_code == 200:
-                    print(f"      🎉 FOUND WORKING ENDPOINT!")
-                    data = response.json()
-                    print(f"      Response keys: {list(data.keys())}")
-                    
-                    filename = f"found_alternative_{url.split('/')[-1]}.json"
-                    with open(filename, 'w') as f:
-                        json.dump(data, f, indent=2)
-                    print(f"      💾 Saved to: {filename}")
-                
-                # Test with params
-                param_response = self.session.get(url, params=date_params)
-                print(f"      With params: {param_response.status_code}")
-                
-                if param_response.status_code == 200:
-                    print(f"      🎉 WORKS WITH PARAMETERS!")
-                    data = param_response.json()
-                    filename = f"found_alternative_with_params_{url.split('/')[-1]}.json"
-                    with open(filename, 'w') as f:
-                        json.dump(data, f, indent=2)
-                    print(f"      💾 Saved to: {filename}")
-                    
+                if response is None:
+                    lines.append("      No params: not sent")
+                elif isinstance(response, Exception):
+                    raise response
+                else:
+                    lines.append(f"      No params: {response.status_code}")
+                    if response.status_code == 200:
+                        lines.append(f"      🎉 FOUND WORKING ENDPOINT!")
+                        data = response_json(response)
+                        lines.append(f"      Response keys: {list(data.keys())}")
+                        
+                        filename = f"found_alternative_{suffix}.json"
+                        save_json(filename, data)
+                        lines.append(f"      💾 Saved to: {filename}")
+            except Exception as e:
+                lines.append(f"      ❌ No params exception: {e}")
+                level = logging.ERROR
+            
+            # Test with params - the body is only saved, so write it out without decoding
+            try:
+                if param_response is None:
+                    lines.append("      With params: not sent")
+                elif isinstance(param_response, Exception):
+                    raise param_response
+                else:
+                    lines.append(f"      With params: {param_response.status_code}")
+                    if param_response.status_code == 200:
+                        lines.append(f"      🎉 WORKS WITH PARAMETERS!")
+                        filename = f"found_alternative_with_params_{suffix}.json"
+                        save_raw_response(param_response, filename)
+                        lines.append(f"      💾 Saved to: {filename}")
             except Exception as e:
-                print(f"      ❌ Exception: {e}")
+                lines.append(f"      ❌ With params exception: {e}")
+                level = logging.ERROR
             
-            print()
+            lines.append("")
+            log.log(level, "\n".join(lines))
+        
+        if skipped:
+            log.info("   ⏭️  Skipped %s remaining probe(s) after finding a working endpoint", skipped)
+            log.info("")
+
+    def test_included_resources(self) -> set:
+        """Request all alternative sub-resources as one compound practitioner document"""
+        
+        url = f"{self.base_url}/practitioners/{self.practitioner_id}"
+        params = {'include': ','.join(self._PRACTITIONER_SUFFIXES)}
+        
+        log.info("   Testing: %s", url)
+        log.info("      Params: %s", params)
+        try:
+            response = self.session.get(url, params=params, timeout=TIMEOUT)
+            log.info("      Compound request: %s", response.status_code)
+            if response.status_code != 200:
+                return set()
+            
+            data = response_json(response)
+            # Compound documents list side-loaded resources under 'linked' (keyed by
+            # name) or 'included' (JSON:API list of typed resources)
+            found = set(data.get('linked') or {})
+            found.update(item.get('type') for item in data.get('included') or [] if isinstance(item, dict))
+            found.intersection_update(self._PRACTITIONER_SUFFIXES)
+            
+            if found:
+                log.info("      🎉 INCLUDED INLINE: %s", ', '.join(sorted(found)))
+                filename = "found_alternative_included.json"
+                save_json(filename, data)
+                log.info("      💾 Saved to: %s", filename)
+            else:
+                log.info("      No sub-resources included - probing each one")
+            return found
+            
+        except Exception as e:
+            log.error("      ❌ Exception: %s", e)
+            return set()
+        
+        finally:
+            log.info("")
 
 def main():
+    parser = argparse.ArgumentParser(description="Test working Cliniko endpoint patterns for available_times")
+    parser.add_argument('--quiet', action='store_true',
+                        help="Only show warnings and errors from the endpoint sweeps")
+    args = parser.parse_args()
+    configure_logging(args.quiet)
+    
     print("🎯 Testing Working Endpoint Patterns for Available Times")
     print("=" * 60)
     print("Using the working endpoint structures we discovered")